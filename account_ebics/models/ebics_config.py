@@ -4,12 +4,17 @@
 import logging
 import os
 import re
+import string
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
+ORDER_NUMBER_DIGITS = string.digits + string.ascii_uppercase
+ORDER_NUMBER_MIN = int("A000", 36)
+ORDER_NUMBER_MAX = int("ZZZZ", 36)
+
 
 class EbicsConfig(models.Model):
     """
@@ -191,20 +196,16 @@ class EbicsConfig(models.Model):
         return self.order_number
 
     def _update_order_number(self, OrderID):
-        o_list = list(OrderID)
-        for i, c in enumerate(reversed(o_list), start=1):
-            if c == "9":
-                o_list[-i] = "A"
-                break
-            if c == "Z":
-                o_list[-i] = "0"
-                continue
-            else:
-                o_list[-i] = chr(ord(c) + 1)
-                break
-        next_order_number = "".join(o_list)
-        if next_order_number == "ZZZZ":
-            next_order_number = "A000"
+        """
+        The OrderID is a base 36 counter running from 'A000' to 'ZZZY'.
+        """
+        nr = int(OrderID, 36) + 1
+        if nr >= ORDER_NUMBER_MAX:
+            nr = ORDER_NUMBER_MIN
+        next_order_number = ""
+        for _i in range(4):
+            nr, digit = divmod(nr, 36)
+            next_order_number = ORDER_NUMBER_DIGITS[digit] + next_order_number
         self.order_number = next_order_number
 
     def _check_ebics_keys(self):
@@ -4,19 +4,32 @@
 import base64
 import logging
 from copy import deepcopy
-from sys import exc_info
-from traceback import format_exception
+from functools import lru_cache
+from traceback import format_exc
 
 from lxml import etree
 
-from odoo import _, fields, models
+from odoo import _, fields, models, tools
 from odoo.exceptions import UserError
 
 from odoo.addons.base.models.res_bank import sanitize_account_number
 
 _logger = logging.getLogger(__name__)
+_MODULE = __name__.split("addons.")[1].split(".")[0]
 
 DUP_CHECK_FORMATS = ["cfonb120", "camt053"]
+FILE_FORMAT_SPEC = (
+    ("cfonb120", "_process_cfonb120", "_unlink_cfonb120"),
+    ("camt.052", "_process_camt052", "_unlink_camt052"),
+    ("camt.053", "_process_camt053", "_unlink_camt053"),
+    ("camt.054", "_process_camt054", "_unlink_camt054"),
+    ("pain.002", "_process_pain002", "_unlink_pain002"),
+)
+CAMT_VARIANT_TAGS = {
+    "052": "Rpt",
+    "053": "Stmt",
+    "054": "Ntfctn",
+}
 
 
 class EbicsFile(models.Model):
@@ -135,36 +148,36 @@ class EbicsFile(models.Model):
         for extra file formats.
         """
         res = {
-            "cfonb120": {
-                "process": self._process_cfonb120,
-                "unlink": self._unlink_cfonb120,
-            },
-            "camt.052": {
-                "process": self._process_camt052,
-                "unlink": self._unlink_camt052,
-            },
-            "camt.053": {
-                "process": self._process_camt053,
-                "unlink": self._unlink_camt053,
-            },
-            "camt.054": {
-                "process": self._process_camt054,
-                "unlink": self._unlink_camt054,
-            },
-            "pain.002": {
-                "process": self._process_pain002,
-                "unlink": self._unlink_pain002,
-            },
+            key: {"process": getattr(self, process), "unlink": getattr(self, unlink)}
+            for key, process, unlink in FILE_FORMAT_SPEC
         }
         return res
 
-    def _check_import_module(self, module, raise_if_not_found=True):
-        mod = (
+    @tools.ormcache("module")
+    def _module_installed(self, module):
+        return bool(
+            self.env["ir.module.module"]
+            .sudo()
+            .search_count(
+                [("name", "=like", module), ("state", "=", "installed")], limit=1
+            )
+        )
+
+    @tools.ormcache("modules")
+    def _installed_modules(self, modules):
+        """
+        Return the names of the given modules that are installed,
+        using a single query.
+        """
+        mods = (
             self.env["ir.module.module"]
             .sudo()
-            .search([("name", "=like", module), ("state", "=", "installed")])
+            .search([("name", "in", modules), ("state", "=", "installed")])
         )
-        if not mod:
+        return frozenset(mods.mapped("name"))
+
+    def _check_import_module(self, module, raise_if_not_found=True):
+        if not self._module_installed(module):
             if raise_if_not_found:
                 raise UserError(
                     _(
@@ -253,14 +266,14 @@ class EbicsFile(models.Model):
             errors = []
             warnings = []
             for notif in notifications:
-                if isinstance(notif, dict) and notif["type"] == "error":
-                    error_cnt += 1
-                    parts = [notif[k] for k in notif if k in ("message", "details")]
-                    errors.append("\n".join(parts))
-                elif isinstance(notif, dict) and notif["type"] == "warning":
-                    warning_cnt += 1
-                    parts = [notif[k] for k in notif if k in ("message", "details")]
-                    warnings.append("\n".join(parts))
+                if isinstance(notif, dict):
+                    parts = [notif[k] for k in ("message", "details") if k in notif]
+                    if notif["type"] == "error":
+                        error_cnt += 1
+                        errors.append("\n".join(parts))
+                    elif notif["type"] == "warning":
+                        warning_cnt += 1
+                        warnings.append("\n".join(parts))
                 elif isinstance(notif, str):
                     warning_cnt += 1
                     warnings.append(notif + "\n")
@@ -293,12 +306,11 @@ class EbicsFile(models.Model):
                 cpy=statement.company_id.name,
             )
         if statements:
-            self.sudo().bank_statement_ids = [(4, x) for x in statements.ids]
-        company_ids = self.sudo().bank_statement_ids.mapped("company_id").ids
+            statements.sudo().write({"ebics_file_id": self.id})
+        company_ids = self.sudo().bank_statement_ids.company_id.ids
         self.company_ids = [(6, 0, company_ids)]
         ctx = dict(self.env.context, statement_ids=statements.ids)
-        module = __name__.split("addons.")[1].split(".")[0]
-        result_view = self.env.ref("%s.ebics_file_view_form_result" % module)
+        result_view = self.env.ref(f"{_MODULE}.ebics_file_view_form_result")
         return {
             "name": _("Import EBICS File"),
             "res_id": self.id,
@@ -366,8 +378,7 @@ class EbicsFile(models.Model):
         Statements without transactions are removed.
         """
         datas = []
-        file_data = base64.b64decode(self.data)
-        file_data.replace(b"\n", b"").replace(b"\r", b"")
+        file_data = base64.b64decode(self.data).translate(None, b"\r\n")
         if len(file_data) % 120:
             message = _(
                 "Incorrect CFONB120 file:\n"
@@ -376,37 +387,54 @@ class EbicsFile(models.Model):
             res["notifications"].append({"type": "error", "message": message})
             return datas
 
-        lines = []
-        for i in range(0, len(file_data), 120):
-            lines.append(file_data[i : i + 120])
-
-        st_lines = b""
-        transactions = False
-        for line in lines:
-            rec_type = line[0:2]
-            currency_code = line[16:19].decode()
-            acc_number = line[21:32].decode()
-            st_lines += line + b"\n"
-            if rec_type == b"04":
-                transactions = True
-            if rec_type == b"07":
-                if transactions:
-                    currency, journal = self._lookup_journal(
-                        res, acc_number, currency_code
-                    )
-                    if currency and journal:
-                        datas.append(
-                            {
-                                "acc_number": acc_number,
-                                "journal_id": journal.id,
-                                "company_id": journal.company_id.id,
-                                "data": base64.b64encode(st_lines),
-                            }
-                        )
-                st_lines = b""
-                transactions = False
+        mv = memoryview(file_data)
+        for st_start, st_end in self._scan_cfonb(file_data):
+            last_line = mv[st_end - 120 : st_end]
+            currency_code = last_line[16:19].tobytes().decode()
+            acc_number = last_line[21:32].tobytes().decode()
+            currency, journal = self._lookup_journal(res, acc_number, currency_code)
+            if not (currency and journal):
+                continue
+            st_lines = bytearray()
+            for i in range(st_start, st_end, 120):
+                st_lines += mv[i : i + 120]
+                st_lines += b"\n"
+            datas.append(
+                {
+                    "acc_number": acc_number,
+                    "journal_id": journal.id,
+                    "company_id": journal.company_id.id,
+                    "data": bytes(st_lines),
+                }
+            )
         return datas
 
+    def _scan_cfonb(self, file_data, line_len=120):
+        """
+        Return the (start, end) offsets of the statements with transactions
+        within a CFONB file without line terminators.
+        """
+        # scan the strided record type columns with bytes.find()
+        # instead of slicing every line
+        col0 = file_data[0::line_len]
+        col1 = file_data[1::line_len]
+
+        def find_rec(char, start, end):
+            pos = col1.find(char, start, end)
+            while pos >= 0 and col0[pos] != ord("0"):
+                pos = col1.find(char, pos + 1, end)
+            return pos
+
+        bounds = []
+        st_start = 0
+        st_end = find_rec(b"7", 0, len(col1))
+        while st_end >= 0:
+            if find_rec(b"4", st_start, st_end) >= 0:
+                bounds.append((st_start * line_len, (st_end + 1) * line_len))
+            st_start = st_end + 1
+            st_end = find_rec(b"7", st_start, len(col1))
+        return bounds
+
     def _process_camt052(self):
         import_module = "account_statement_import_camt"
         self._check_import_module(import_module)
@@ -443,11 +471,8 @@ class EbicsFile(models.Model):
             ("oca", "account_statement_import_camt"),
             ("oe", "account_bank_statement_import_camt"),
         ]
-        author = False
-        for entry in modules:
-            if self._check_import_module(entry[1], raise_if_not_found=False):
-                author = entry[0]
-                break
+        installed = self._installed_modules(tuple(x[1] for x in modules))
+        author = next((x[0] for x in modules if x[1] in installed), False)
         if not author:
             raise UserError(
                 _(
@@ -468,37 +493,55 @@ class EbicsFile(models.Model):
         return self._process_download_result(res, file_format=file_format)
 
     def _process_bank_statement_oca(self, res, st_datas):
+        wizards = {}
         for st_data in st_datas:
+            company_id = st_data["company_id"]
+            if company_id not in wizards:
+                wizards[company_id] = self._get_statement_import_wizard(company_id)
             try:
                 with self.env.cr.savepoint():
-                    self._create_bank_statement_oca(res, st_data)
+                    self._create_bank_statement_oca(
+                        res, st_data, wiz=wizards[company_id]
+                    )
             except UserError as e:
                 res["notifications"].append(
                     {"type": "error", "message": "".join(e.args)}
                 )
             except Exception:
-                tb = "".join(format_exception(*exc_info()))
+                _logger.exception(
+                    "EBICS File %s, import of statement for account %s failed",
+                    self.name,
+                    st_data["acc_number"],
+                )
+                tb = format_exc(limit=-20)
                 res["notifications"].append({"type": "error", "message": tb})
 
-    def _create_bank_statement_oca(self, res, st_data):
-        wiz = (
+    def _get_statement_import_wizard(self, company_id):
+        return (
             self.env["account.statement.import"]
-            .with_company(st_data["company_id"])
+            .with_company(company_id)
             .with_context(active_model="ebics.file")
             .create({"statement_filename": self.name})
         )
-        wiz.import_single_file(base64.b64decode(st_data["data"]), res)
+
+    def _create_bank_statement_oca(self, res, st_data, wiz=None):
+        wiz = wiz or self._get_statement_import_wizard(st_data["company_id"])
+        wiz.import_single_file(st_data["data"], res)
 
     def _process_bank_statement_oe(self, res, st_datas):
         """
-        We execute a cr.commit() after every statement import since we get a
-        'savepoint does not exist' error when using 'with self.env.cr.savepoint()'.
+        We commit before every statement import and roll back a failed one
+        since we get a 'savepoint does not exist' error when using
+        'with self.env.cr.savepoint()'.
         """
-        for st_data in st_datas:
+        for i, st_data in enumerate(st_datas, start=1):
+            self.env.cr.commit()  # pylint: disable=E8102
+            st_cnt = len(res["statement_ids"])
             try:
                 self._create_bank_statement_oe(res, st_data)
-                self.env.cr.commit()  # pylint: disable=E8102
             except UserError as e:
+                self.env.cr.rollback()
+                del res["statement_ids"][st_cnt:]
                 msg = "".join(e.args)
                 msg += "\n"
                 msg += _(
@@ -507,8 +550,18 @@ class EbicsFile(models.Model):
                 )
                 res["notifications"].append({"type": "error", "message": msg})
             except Exception:
-                tb = "".join(format_exception(*exc_info()))
+                self.env.cr.rollback()
+                del res["statement_ids"][st_cnt:]
+                _logger.exception(
+                    "EBICS File %s, import of statement %s of %s failed",
+                    self.name,
+                    i,
+                    len(st_datas),
+                )
+                tb = format_exc(limit=-20)
                 res["notifications"].append({"type": "error", "message": tb})
+        if st_datas:
+            self.env.cr.commit()  # pylint: disable=E8102
 
     def _create_bank_statement_oe(self, res, st_data):
         attachment = (
@@ -517,7 +570,7 @@ class EbicsFile(models.Model):
             .create(
                 {
                     "name": self.name,
-                    "datas": st_data["data"],
+                    "datas": base64.b64encode(st_data["data"]),
                     "store_fname": self.name,
                 }
             )
@@ -553,60 +606,69 @@ class EbicsFile(models.Model):
         """
         datas = []
         file_data = base64.b64decode(self.data)
-        root = etree.fromstring(file_data, parser=etree.XMLParser(recover=True))
+        parser = etree.XMLParser(
+            recover=True,
+            huge_tree=True,
+            resolve_entities=False,
+            no_network=True,
+            load_dtd=False,
+            remove_blank_text=True,
+        )
+        root = etree.fromstring(file_data, parser=parser)
         if root is None:
             message = _("Invalid XML file.")
             res["notifications"].append({"type": "error", "message": message})
         ns = {k or "ns": v for k, v in root.nsmap.items()}
         camt_variant = ns["ns"].split("camt.")[1][:3]
-        variant_tags = {
-            "052": "Rpt",
-            "053": "Stmt",
-            "054": "Ntfctn",
-        }
-        camt_tag = variant_tags[camt_variant]
-        stmts = root[0].findall(f"ns:{camt_tag}", ns)
-        for i, stmt in enumerate(stmts):
-            acc_number = sanitize_account_number(
-                stmt.xpath(
-                    "ns:Acct/ns:Id/ns:IBAN/text() | ns:Acct/ns:Id/ns:Othr/ns:Id/text()",
-                    namespaces=ns,
-                )[0]
-            )
+        camt_tag = CAMT_VARIANT_TAGS[camt_variant]
+        xp_stmts = etree.XPath(f"ns:{camt_tag}", namespaces=ns)
+        xp_acc_number = etree.XPath(
+            "ns:Acct/ns:Id/ns:IBAN/text() | ns:Acct/ns:Id/ns:Othr/ns:Id/text()",
+            namespaces=ns,
+        )
+        xp_currency = etree.XPath(
+            "ns:Acct/ns:Ccy/text() | ns:Bal/ns:Amt/@Ccy", namespaces=ns
+        )
+        sanitize = lru_cache(maxsize=64)(sanitize_account_number)
+        stmts = xp_stmts(root[0])
+        doc = etree.Element(root.tag, attrib=root.attrib, nsmap=root.nsmap)
+        grp = etree.SubElement(doc, root[0].tag, attrib=root[0].attrib)
+        stmt_tag = etree.QName(ns["ns"], camt_tag).text
+        stmt_pos = None
+        for el in root[0]:
+            if el.tag == stmt_tag:
+                stmt_pos = len(grp) if stmt_pos is None else stmt_pos
+                continue
+            grp.append(deepcopy(el))
+        for stmt in stmts:
+            acc_number = sanitize(xp_acc_number(stmt)[0])
             if not acc_number:
                 message = _("No bank account number found.")
                 res["notifications"].append({"type": "error", "message": message})
                 continue
-            currency_code = stmt.xpath(
-                "ns:Acct/ns:Ccy/text() | ns:Bal/ns:Amt/@Ccy", namespaces=ns
-            )[0]
+            currency_code = xp_currency(stmt)[0]
             # some banks (e.g. COMMERZBANK) add the currency as the last 3 digits
             # of the bank account number hence we need to remove this since otherwise
             # the journal matching logic fails
             if acc_number[-3:] == currency_code:
                 acc_number = acc_number[:-3]
 
-            root_new = deepcopy(root)
-            entries = False
-            for j, el in enumerate(root_new[0].findall(f"ns:{camt_tag}", ns)):
-                if j != i:
-                    el.getparent().remove(el)
-                else:
-                    entries = el.findall("ns:Ntry", ns)
-            if not entries:
+            if not stmt.findall("ns:Ntry", ns):
                 continue
-            else:
-                currency, journal = self._lookup_journal(res, acc_number, currency_code)
-                if not (currency and journal):
-                    continue
-                datas.append(
-                    {
-                        "acc_number": acc_number,
-                        "journal_id": journal.id,
-                        "company_id": journal.company_id.id,
-                        "data": base64.b64encode(etree.tostring(root_new)),
-                    }
-                )
+            currency, journal = self._lookup_journal(res, acc_number, currency_code)
+            if not (currency and journal):
+                continue
+            grp.insert(stmt_pos, stmt)
+            data = etree.tostring(doc, xml_declaration=True, encoding="UTF-8")
+            grp.remove(stmt)
+            datas.append(
+                {
+                    "acc_number": acc_number,
+                    "journal_id": journal.id,
+                    "company_id": journal.company_id.id,
+                    "data": data,
+                }
+            )
 
         return datas
 
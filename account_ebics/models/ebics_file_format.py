@@ -1,7 +1,7 @@
 # Copyright 2009-2024 Noviat.
 # License LGPL-3 or later (http://www.gnu.org/licenses/lgpl).
 
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
 
 
 class EbicsFileFormat(models.Model):
@@ -102,8 +102,11 @@ class EbicsFileFormat(models.Model):
 
     @api.model
     def _selection_download_process_method(self):
-        methods = self.env["ebics.file"]._file_format_methods().keys()
-        return [(x, x) for x in methods]
+        return [(x, x) for x in self._get_download_process_methods()]
+
+    @tools.ormcache()
+    def _get_download_process_methods(self):
+        return tuple(self.env["ebics.file"]._file_format_methods())
 
     @api.onchange("type")
     def _onchange_type(self):
@@ -112,6 +115,7 @@ class EbicsFileFormat(models.Model):
 
     @api.depends("ebics_version", "name", "btf_message", "description")
     def _compute_display_name(self):
+        self.fetch(["ebics_version", "name", "btf_message", "description"])
         for rec in self:
             name = rec.ebics_version == "2" and rec.name or rec.btf_message
             if rec.description:
@@ -4,14 +4,14 @@
 import base64
 import logging
 import os
-from sys import exc_info
-from traceback import format_exception
+from functools import lru_cache
 from urllib.error import URLError
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
+_MODULE = __name__.split("addons.")[1].split(".")[0]
 
 try:
     import fintech
@@ -25,8 +25,30 @@ try:
     )
 
     fintech.cryptolib = "cryptography"
+    FINTECH_SIG_PASSPHRASE = fintech.__version_info__ >= (7, 3, 1)
 except ImportError:
     _logger.warning("Failed to import fintech")
+    FINTECH_SIG_PASSPHRASE = False
+
+INI_LETTER_LANGS = frozenset(("FR", "DE"))
+X509_DN_ATTRS = (
+    ("ebics_key_x509_dn_cn", "commonName"),
+    ("ebics_key_x509_dn_o", "organizationName"),
+    ("ebics_key_x509_dn_ou", "organizationalUnitName"),
+    ("ebics_key_x509_dn_c", "countryName"),
+    ("ebics_key_x509_dn_st", "stateOrProvinceName"),
+    ("ebics_key_x509_dn_l", "localityName"),
+    ("ebics_key_x509_dn_e", "emailAddress"),
+)
+
+
+@lru_cache(maxsize=64)
+def _scan_keys_dir(keys_dir, mtime_ns):
+    try:
+        with os.scandir(keys_dir) as entries:
+            return frozenset(entry.name for entry in entries if entry.is_file())
+    except OSError:
+        return frozenset()
 
 
 class EbicsBank(EbicsBank):
@@ -89,7 +111,7 @@ class EbicsUserID(models.Model):
         help="Use this parameter to limit the transactions for this User "
         "to downloads or uploads.",
     )
-    ebics_keys_fn = fields.Char(compute="_compute_ebics_keys_fn")
+    ebics_keys_fn = fields.Char(compute="_compute_ebics_keys_fn", store=True)
     ebics_keys_found = fields.Boolean(compute="_compute_ebics_keys_found")
     ebics_passphrase = fields.Char(string="EBICS Passphrase")
     ebics_passphrase_store = fields.Boolean(
@@ -191,20 +213,37 @@ class EbicsUserID(models.Model):
 
     @api.depends("name", "ebics_config_id.ebics_keys")
     def _compute_ebics_keys_fn(self):
+        self.ebics_config_id.fetch(["ebics_keys"])
         for rec in self:
             keys_dir = rec.ebics_config_id.ebics_keys
             rec.ebics_keys_fn = (
                 rec.name
                 and keys_dir
-                and (keys_dir + "/" + rec.name.replace(" ", "_") + "_keys")
+                and f"{keys_dir}/{rec.name.replace(' ', '_')}_keys"
             )
 
     @api.depends("ebics_keys_fn")
     def _compute_ebics_keys_found(self):
+        dir_files = {}
         for rec in self:
-            rec.ebics_keys_found = rec.ebics_keys_fn and os.path.isfile(
-                rec.ebics_keys_fn
-            )
+            if not rec.ebics_keys_fn:
+                rec.ebics_keys_found = False
+                continue
+            keys_dir, fn = os.path.split(rec.ebics_keys_fn)
+            if keys_dir not in dir_files:
+                dir_files[keys_dir] = self._get_keys_dir_files(keys_dir)
+            rec.ebics_keys_found = fn in dir_files[keys_dir]
+
+    def _get_keys_dir_files(self, keys_dir):
+        """
+        Return the names of the files in the keys directory.
+        The directory is only rescanned when its mtime has changed.
+        """
+        try:
+            mtime_ns = os.stat(keys_dir).st_mtime_ns
+        except OSError:
+            return frozenset()
+        return _scan_keys_dir(keys_dir, mtime_ns)
 
     @api.depends("state", "ebics_passphrase", "ebics_keys_found")
     def _compute_ebics_passphrase_view_modifiers(self):
@@ -225,12 +264,13 @@ class EbicsUserID(models.Model):
 
     @api.depends("state")
     def _compute_ebics_sig_passphrase_invisible(self):
+        if not FINTECH_SIG_PASSPHRASE:
+            self.ebics_sig_passphrase_invisible = True
+            return
         for rec in self:
-            rec.ebics_sig_passphrase_invisible = True
-            if fintech.__version_info__ < (7, 3, 1):
-                continue
-            if rec.transaction_rights != "down" and rec.state == "draft":
-                rec.ebics_sig_passphrase_invisible = False
+            rec.ebics_sig_passphrase_invisible = not (
+                rec.transaction_rights != "down" and rec.state == "draft"
+            )
 
     @api.constrains("ebics_key_x509")
     def _check_ebics_key_x509(self):
@@ -240,17 +280,15 @@ class EbicsUserID(models.Model):
 
     @api.constrains("ebics_passphrase")
     def _check_ebics_passphrase(self):
-        for rec in self:
-            if rec.ebics_passphrase and len(rec.ebics_passphrase) < 8:
-                raise UserError(_("The Passphrase must be at least 8 characters long"))
+        if any(len(x) < 8 for x in self.mapped("ebics_passphrase") if x):
+            raise UserError(_("The Passphrase must be at least 8 characters long"))
 
     @api.constrains("ebics_sig_passphrase")
     def _check_ebics_sig_passphrase(self):
-        for rec in self:
-            if rec.ebics_sig_passphrase and len(rec.ebics_sig_passphrase) < 8:
-                raise UserError(
-                    _("The Signature Passphrase must be at least 8 characters long")
-                )
+        if any(len(x) < 8 for x in self.mapped("ebics_sig_passphrase") if x):
+            raise UserError(
+                _("The Signature Passphrase must be at least 8 characters long")
+            )
 
     @api.onchange("ebics_version")
     def _onchange_ebics_version(self):
@@ -328,27 +366,10 @@ class EbicsUserID(models.Model):
 
         ebics_version = self.ebics_config_id.ebics_version
         try:
-            keyring_params = {
-                "keys": self.ebics_keys_fn,
-                "passphrase": self.ebics_passphrase,
-            }
-            if self.ebics_sig_passphrase:
-                keyring_params["sig_passphrase"] = self.ebics_sig_passphrase
-            keyring = EbicsKeyRing(**keyring_params)
-            bank = EbicsBank(
-                keyring=keyring,
-                hostid=self.ebics_config_id.ebics_host,
-                url=self.ebics_config_id.ebics_url,
-            )
-            user = EbicsUser(
-                keyring=keyring,
-                partnerid=self.ebics_config_id.ebics_partner,
-                userid=self.name,
-            )
+            bank, user = self._get_ebics_bank_user()
         except Exception as err:
-            exctype, value = exc_info()[:2]
             error = _("EBICS Initialisation Error:")
-            error += "\n" + str(exctype) + "\n" + str(value)
+            error += "\n" + str(type(err)) + "\n" + str(err)
             raise UserError(error) from err
 
         self.ebics_config_id._check_ebics_keys()
@@ -358,7 +379,7 @@ class EbicsUserID(models.Model):
                 # enable import of all type of certicates: A00x, X002, E002
                 if self.swift_3skey:
                     kwargs = {
-                        self.ebics_config_id.ebics_key_version: base64.decodebytes(
+                        self.ebics_config_id.ebics_key_version: base64.b64decode(
                             self.swift_3skey_certificate
                         ),
                     }
@@ -368,9 +389,8 @@ class EbicsUserID(models.Model):
                     bitlength=self.ebics_config_id.ebics_key_bitlength,
                 )
             except Exception as err:
-                exctype, value = exc_info()[:2]
                 error = _("EBICS Initialisation Error:")
-                error += "\n" + str(exctype) + "\n" + str(value)
+                error += "\n" + str(type(err)) + "\n" + str(err)
                 raise UserError(error) from err
 
         if self.swift_3skey and not self.ebics_key_x509:
@@ -382,22 +402,15 @@ class EbicsUserID(models.Model):
             )
 
         if self.ebics_key_x509:
-            dn_attrs = {
-                "commonName": self.ebics_key_x509_dn_cn,
-                "organizationName": self.ebics_key_x509_dn_o,
-                "organizationalUnitName": self.ebics_key_x509_dn_ou,
-                "countryName": self.ebics_key_x509_dn_c,
-                "stateOrProvinceName": self.ebics_key_x509_dn_st,
-                "localityName": self.ebics_key_x509_dn_l,
-                "emailAddress": self.ebics_key_x509_dn_e,
+            self.fetch([x[0] for x in X509_DN_ATTRS])
+            kwargs = {
+                dn_attr: self[field] for field, dn_attr in X509_DN_ATTRS if self[field]
             }
-            kwargs = {k: v for k, v in dn_attrs.items() if v}
             user.create_certificates(**kwargs)
 
         try:
             client = EbicsClient(bank, user, version=ebics_version)
         except RuntimeError as err:
-            e = exc_info()
             error = _("EBICS Initialization Error:")
             error += "\n"
             error += err.args[0]
@@ -424,31 +437,23 @@ class EbicsUserID(models.Model):
             if ebics_version == "H003":
                 self.ebics_config_id._update_order_number(OrderID)
         except URLError as err:
-            exctype, value = exc_info()[:2]
-            tb = "".join(format_exception(*exc_info()))
-            _logger.error(
-                "EBICS INI command error\nUserID: %s\n%s",
-                self.name,
-                tb,
-            )
+            _logger.exception("EBICS INI command error\nUserID: %s", self.name)
             raise UserError(
                 _(
                     "urlopen error:\n url '%(url)s' - %(val)s",
                     url=self.ebics_config_id.ebics_url,
-                    val=str(value),
+                    val=str(err),
                 )
             ) from err
         except EbicsFunctionalError as err:
-            e = exc_info()
             error = _("EBICS Functional Error:")
             error += "\n"
-            error += f"{e[1].message} (code: {e[1].code})"
+            error += f"{err.message} (code: {err.code})"
             raise UserError(error) from err
         except EbicsTechnicalError as err:
-            e = exc_info()
             error = _("EBICS Technical Error:")
             error += "\n"
-            error += f"{e[1].message} (code: {e[1].code})"
+            error += f"{err.message} (code: {err.code})"
             raise UserError(error) from err
 
         # Send the public authentication and encryption keys to the bank.
@@ -460,18 +465,17 @@ class EbicsUserID(models.Model):
             self.ebics_config_id._update_order_number(OrderID)
 
         # Create an INI-letter which must be printed and sent to the bank.
-        ebics_config_bank = self.ebics_config_id.journal_ids[0].bank_id
         cc = ebics_config_bank.country.code
-        if cc in ["FR", "DE"]:
+        if cc in INI_LETTER_LANGS:
             lang = cc
         else:
-            lang = self.env.user.lang or self.env["res.lang"].search([])[0].code
+            lang = self.env.user.lang or self.env["res.lang"].search([], limit=1).code
             lang = lang[:2]
         fn_date = fields.Date.today().isoformat()
         fn = "_".join([self.ebics_config_id.ebics_host, "ini_letter", fn_date]) + ".pdf"
         letter = user.create_ini_letter(bankname=ebics_config_bank.name, lang=lang)
         vals = {
-            "ebics_ini_letter": base64.encodebytes(letter),
+            "ebics_ini_letter": base64.b64encode(letter),
             "ebics_ini_letter_fn": fn,
             "state": "init",
         }
@@ -501,38 +505,23 @@ class EbicsUserID(models.Model):
         if self.state != "get_bank_keys":
             raise UserError(_("Set state to 'Get Keys from Bank'."))
         try:
-            keyring = EbicsKeyRing(
-                keys=self.ebics_keys_fn, passphrase=self.ebics_passphrase
-            )
-            bank = EbicsBank(
-                keyring=keyring,
-                hostid=self.ebics_config_id.ebics_host,
-                url=self.ebics_config_id.ebics_url,
-            )
-            user = EbicsUser(
-                keyring=keyring,
-                partnerid=self.ebics_config_id.ebics_partner,
-                userid=self.name,
-            )
+            bank, user = self._get_ebics_bank_user()
             client = EbicsClient(bank, user, version=self.ebics_config_id.ebics_version)
         except Exception as err:
-            exctype, value = exc_info()[:2]
             error = _("EBICS Initialisation Error:")
-            error += "\n" + str(exctype) + "\n" + str(value)
+            error += "\n" + str(type(err)) + "\n" + str(err)
             raise UserError(error) from err
 
         try:
             public_bank_keys = client.HPB()
         except EbicsFunctionalError as err:
-            e = exc_info()
             error = _("EBICS Functional Error:")
             error += "\n"
-            error += f"{e[1].message} (code: {e[1].code})"
+            error += f"{err.message} (code: {err.code})"
             raise UserError(error) from err
         except Exception as err:
-            exctype, value = exc_info()[:2]
             error = _("EBICS Initialisation Error:")
-            error += "\n" + str(exctype) + "\n" + str(value)
+            error += "\n" + str(type(err)) + "\n" + str(err)
             raise UserError(error) from err
 
         public_bank_keys = public_bank_keys.encode()
@@ -542,7 +531,7 @@ class EbicsUserID(models.Model):
             + ".txt"
         )
         vals = {
-            "ebics_public_bank_keys": base64.encodebytes(public_bank_keys),
+            "ebics_public_bank_keys": base64.b64encode(public_bank_keys),
             "ebics_public_bank_keys_fn": fn,
             "state": "to_verify",
         }
@@ -559,24 +548,36 @@ class EbicsUserID(models.Model):
         if self.state != "to_verify":
             raise UserError(_("Set state to 'Verification'."))
 
-        keyring = EbicsKeyRing(
-            keys=self.ebics_keys_fn, passphrase=self.ebics_passphrase
-        )
+        bank = self._get_ebics_bank_user()[0]
+        bank.activate_keys()
+        vals = {"state": "active_keys"}
+        self._update_passphrase_vals(vals)
+        return self.write(vals)
+
+    def _get_ebics_bank_user(self):
+        keyring_params = {
+            "keys": self.ebics_keys_fn,
+            "passphrase": self.ebics_passphrase,
+        }
+        if self.ebics_sig_passphrase:
+            keyring_params["sig_passphrase"] = self.ebics_sig_passphrase
+        keyring = EbicsKeyRing(**keyring_params)
         bank = EbicsBank(
             keyring=keyring,
             hostid=self.ebics_config_id.ebics_host,
             url=self.ebics_config_id.ebics_url,
         )
-        bank.activate_keys()
-        vals = {"state": "active_keys"}
-        self._update_passphrase_vals(vals)
-        return self.write(vals)
+        user = EbicsUser(
+            keyring=keyring,
+            partnerid=self.ebics_config_id.ebics_partner,
+            userid=self.name,
+        )
+        return bank, user
 
     def change_passphrase(self):
         self.ensure_one()
         ctx = dict(self.env.context, default_ebics_userid_id=self.id)
-        module = __name__.split("addons.")[1].split(".")[0]
-        view = self.env.ref("%s.ebics_change_passphrase_view_form" % module)
+        view = self.env.ref(f"{_MODULE}.ebics_change_passphrase_view_form")
         return {
             "name": _("EBICS keys change passphrase"),
             "view_type": "form",
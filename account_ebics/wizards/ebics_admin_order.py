@@ -5,6 +5,15 @@ import pprint
 
 from odoo import _, api, fields, models
 
+_MODULE = __name__.split("addons.")[1].split(".")[0]
+RESULT_ACTION = {
+    "view_type": "form",
+    "view_mode": "form",
+    "res_model": "ebics.admin.order",
+    "target": "new",
+    "type": "ir.actions.act_window",
+}
+
 
 class EbicsAdminOrder(models.TransientModel):
     _inherit = "ebics.xfer"
@@ -35,18 +44,12 @@ class EbicsAdminOrder(models.TransientModel):
             )
         else:
             data = getattr(client, self.admin_order_type)(parsed=True)
-            pp = pprint.PrettyPrinter()
-            self.note = pp.pformat(data)
-        module = __name__.split("addons.")[1].split(".")[0]
-        result_view = self.env.ref("%s.ebics_admin_order_view_form_result" % module)
-        return {
-            "name": _("EBICS Administrative Order result"),
-            "res_id": self.id,
-            "view_type": "form",
-            "view_mode": "form",
-            "res_model": "ebics.admin.order",
-            "view_id": result_view.id,
-            "target": "new",
-            "context": self.env.context,
-            "type": "ir.actions.act_window",
-        }
+            self.note = pprint.pformat(data)
+        result_view = self.env.ref(f"{_MODULE}.ebics_admin_order_view_form_result")
+        return dict(
+            RESULT_ACTION,
+            name=_("EBICS Administrative Order result"),
+            res_id=self.id,
+            view_id=result_view.id,
+            context=self.env.context,
+        )
@@ -1,20 +1,38 @@
 # Copyright 2009-2024 Noviat.
 # License LGPL-3 or later (http://www.gnu.org/licenses/lgpl).
 
+import hmac
 import logging
 
 from odoo import _, fields, models
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
+_MODULE = __name__.split("addons.")[1].split(".")[0]
+RESULT_ACTION = {
+    "view_type": "form",
+    "view_mode": "form",
+    "res_model": "ebics.change.passphrase",
+    "target": "new",
+    "type": "ir.actions.act_window",
+}
 
 try:
     import fintech
     from fintech.ebics import EbicsKeyRing
 
     fintech.cryptolib = "cryptography"
+    FINTECH_SIG_PASSPHRASE = fintech.__version_info__ >= (7, 3, 1)
 except ImportError:
     _logger.warning("Failed to import fintech")
+    FINTECH_SIG_PASSPHRASE = False
+
+
+def _passphrase_equal(pass1, pass2):
+    """
+    Constant-time comparison of two (possibly empty) passphrases.
+    """
+    return hmac.compare_digest((pass1 or "").encode(), (pass2 or "").encode())
 
 
 class EbicsChangePassphrase(models.TransientModel):
@@ -31,48 +49,42 @@ class EbicsChangePassphrase(models.TransientModel):
     new_sig_pass = fields.Char(string="New Signature Passphrase")
     new_sig_pass_check = fields.Char(string="New Signature Passphrase (verification)")
     ebics_sig_passphrase_invisible = fields.Boolean(
-        compute="_compute_ebics_sig_passphrase_invisible"
+        compute="_compute_ebics_sig_passphrase_invisible", store=True
     )
     note = fields.Text(string="Notes", readonly=True)
 
     def _compute_ebics_sig_passphrase_invisible(self):
-        for rec in self:
-            if fintech.__version_info__ < (7, 3, 1):
-                rec.ebics_sig_passphrase_invisible = True
-            else:
-                rec.ebics_sig_passphrase_invisible = False
+        self.ebics_sig_passphrase_invisible = not FINTECH_SIG_PASSPHRASE
 
     def change_passphrase(self):
         self.ensure_one()
-        self.note = ""
+        ebics_userid = self.ebics_userid_id
+        stored_pass = ebics_userid.ebics_passphrase
+        store_pass = ebics_userid.ebics_passphrase_store
         if (
-            self.ebics_userid_id.ebics_passphrase_store
+            store_pass
             and self.old_pass
-            and self.old_pass != self.ebics_userid_id.ebics_passphrase
+            and not _passphrase_equal(self.old_pass, stored_pass)
         ):
             raise UserError(_("Incorrect old passphrase."))
-        if self.new_pass != self.new_pass_check:
+        if not _passphrase_equal(self.new_pass, self.new_pass_check):
             raise UserError(_("New passphrase verification error."))
-        if self.new_pass and self.new_pass == self.ebics_userid_id.ebics_passphrase:
+        if self.new_pass and _passphrase_equal(self.new_pass, stored_pass):
             raise UserError(_("New passphrase equal to old passphrase."))
         if (
             self.new_sig_pass
             and self.old_sig_pass
-            and self.new_sig_pass == self.old_sig_pass
+            and _passphrase_equal(self.new_sig_pass, self.old_sig_pass)
         ):
             raise UserError(
                 _("New signature passphrase equal to old signature passphrase.")
             )
-        if self.new_sig_pass != self.new_sig_pass_check:
+        if not _passphrase_equal(self.new_sig_pass, self.new_sig_pass_check):
             raise UserError(_("New signature passphrase verification error."))
-        passphrase = (
-            self.ebics_userid_id.ebics_passphrase_store
-            and self.ebics_userid_id.ebics_passphrase
-            or self.old_pass
-        )
+        passphrase = store_pass and stored_pass or self.old_pass
         try:
             keyring_params = {
-                "keys": self.ebics_userid_id.ebics_keys_fn,
+                "keys": ebics_userid.ebics_keys_fn,
                 "passphrase": passphrase,
             }
             if self.new_sig_pass:
@@ -88,32 +100,40 @@ class EbicsChangePassphrase(models.TransientModel):
         except (ValueError, RuntimeError) as err:
             raise UserError(str(err)) from err
 
+        userid_vals = {}
+        notes = []
         if self.new_pass:
-            self.ebics_userid_id.ebics_passphrase = (
-                self.ebics_userid_id.ebics_passphrase_store and self.new_pass
-            )
-            self.note += "The EBICS Passphrase has been changed."
+            userid_vals["ebics_passphrase"] = store_pass and self.new_pass
+            notes.append("The EBICS Passphrase has been changed.")
         if self.new_sig_pass:
             # removing ebics_sig_passphrase from db should not be required
             # but we do it for double safety
-            if self.ebics_userid_id.ebics_sig_passphrase:
-                self.ebics_userid_id.ebics_sig_passphrase = False
-            self.note += "The EBICS Signature Passphrase has been changed."
+            if ebics_userid.ebics_sig_passphrase:
+                userid_vals["ebics_sig_passphrase"] = False
+            notes.append("The EBICS Signature Passphrase has been changed.")
+        if userid_vals:
+            ebics_userid.write(userid_vals)
 
-        module = __name__.split("addons.")[1].split(".")[0]
+        self.write(
+            {
+                "note": "\n".join(notes),
+                "old_pass": False,
+                "new_pass": False,
+                "new_pass_check": False,
+                "old_sig_pass": False,
+                "new_sig_pass": False,
+                "new_sig_pass_check": False,
+            }
+        )
         result_view = self.env.ref(
-            "%s.ebics_change_passphrase_view_form_result" % module
+            f"{_MODULE}.ebics_change_passphrase_view_form_result"
+        )
+        return dict(
+            RESULT_ACTION,
+            name=_("EBICS Keys Change Passphrase"),
+            res_id=self.id,
+            view_id=result_view.id,
         )
-        return {
-            "name": _("EBICS Keys Change Passphrase"),
-            "res_id": self.id,
-            "view_type": "form",
-            "view_mode": "form",
-            "res_model": "ebics.change.passphrase",
-            "view_id": result_view.id,
-            "target": "new",
-            "type": "ir.actions.act_window",
-        }
 
     def button_close(self):
         self.ensure_one()
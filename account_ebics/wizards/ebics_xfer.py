@@ -3,13 +3,14 @@
 
 import base64
 import logging
-from sys import exc_info
-from traceback import format_exception
+from contextlib import contextmanager
+from traceback import format_exc
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
+_MODULE = __name__.split("addons.")[1].split(".")[0]
 
 try:
     import fintech
@@ -25,19 +26,23 @@ try:
     )
 
     fintech.cryptolib = "cryptography"
+    FINTECH_SIG_PASSPHRASE = fintech.__version_info__ >= (7, 3, 1)
 except ImportError:
     EbicsBank = object
     _logger.warning("Failed to import fintech")
+    FINTECH_SIG_PASSPHRASE = False
 
 
 class EbicsBank(EbicsBank):
+    _order_number = "A000"
+
     def _next_order_id(self, partnerid):
         """
         EBICS protocol version H003 requires generation of the OrderID.
         The OrderID must be a string between 'A000' and 'ZZZZ' and
         unique for each partner id.
         """
-        return hasattr(self, "_order_number") and self._order_number or "A000"
+        return self._order_number or "A000"
 
 
 class EbicsXfer(models.TransientModel):
@@ -105,61 +110,46 @@ class EbicsXfer(models.TransientModel):
             [
                 ("company_ids", "in", self.env.user.company_ids.ids),
                 ("state", "=", "confirm"),
-            ]
+            ],
+            limit=2,
         )
-        if cfg and len(cfg) == 1:
-            return cfg
-        else:
-            return cfg_mod
+        return cfg if len(cfg) == 1 else cfg_mod
 
     def _compute_ebics_sig_passphrase_invisible(self):
-        for rec in self:
-            rec.ebics_sig_passphrase_invisible = True
-            if fintech.__version_info__ < (7, 3, 1):
-                rec.ebics_sig_passphrase_invisible = True
-            else:
-                rec.ebics_sig_passphrase_invisible = False
+        self.ebics_sig_passphrase_invisible = not FINTECH_SIG_PASSPHRASE
 
     @api.depends("ebics_config_id")
     def _compute_upload_format_ids(self):
+        if self.env.context.get("ebics_download"):
+            self.upload_format_ids = False
+            return
+        upload_formats = {}
         for rec in self:
-            rec.upload_format_ids = False
-            if not self.env.context.get("ebics_download"):
-                rec.upload_format_ids = (
-                    rec.ebics_config_id.ebics_file_format_ids.filtered(
-                        lambda r: r.type == "up"
-                    )
+            cfg = rec.ebics_config_id
+            if cfg not in upload_formats:
+                upload_formats[cfg] = cfg.ebics_file_format_ids.filtered(
+                    lambda r: r.type == "up"
                 )
+            rec.upload_format_ids = upload_formats[cfg]
 
     @api.onchange("ebics_config_id")
     def _onchange_ebics_config_id(self):
-        avail_userids = self.ebics_config_id.ebics_userid_ids.filtered(
-            lambda r: self.env.user.id in r.user_ids.ids
-        )
-
-        if self.env.context.get("ebics_download"):  # Download Form
-            avail_formats = self.ebics_config_id.ebics_file_format_ids.filtered(
-                lambda r: r.type == "down"
-            )
-            if avail_formats and len(avail_formats) == 1:
-                self.format_id = avail_formats
-            else:
-                self.format_id = False
-            avail_userids = avail_userids.filtered(
-                lambda r: r.transaction_rights in ["both", "down"]
-            )
-        else:  # Upload Form
-            if not self.env.context.get("active_model") == "account.payment.order":
-                avail_formats = self.ebics_config_id.ebics_file_format_ids.filtered(
-                    lambda r: r.type == "up"
-                )
-                if avail_formats and len(avail_formats) == 1:
-                    self.format_id = avail_formats
-                else:
-                    self.format_id = False
-            avail_userids = avail_userids.filtered(
-                lambda r: r.transaction_rights in ["both", "up"]
+        ebics_config = self.ebics_config_id
+        xfer_type = self.env.context.get("ebics_download") and "down" or "up"
+        if (
+            xfer_type == "down"
+            or self.env.context.get("active_model") != "account.payment.order"
+        ):
+            avail_formats = ebics_config.ebics_file_format_ids.filtered(
+                lambda r: r.type == xfer_type
             )
+            self.format_id = len(avail_formats) == 1 and avail_formats or False
+        avail_userids = ebics_config.ebics_userid_ids.filtered_domain(
+            [
+                ("user_ids", "in", self.env.uid),
+                ("transaction_rights", "in", ("both", xfer_type)),
+            ]
+        )
 
         if avail_userids:
             if len(avail_userids) == 1:
@@ -181,15 +171,11 @@ class EbicsXfer(models.TransientModel):
         self.format_id = False
         self._detect_upload_format()
         if not self.format_id:
-            upload_formats = (
-                self.format_id
-                or self.ebics_config_id.ebics_file_format_ids.filtered(
-                    lambda r: r.type == "up"
-                )
-            )
+            upload_formats = self.upload_format_ids
             if len(upload_formats) > 1:
+                fname_endswith = self.upload_fname.endswith
                 upload_formats = upload_formats.filtered(
-                    lambda r: self.upload_fname.endswith(r.suffix or "")
+                    lambda r: fname_endswith(r.suffix or "")
                 )
             if len(upload_formats) == 1:
                 self.format_id = upload_formats
@@ -200,8 +186,7 @@ class EbicsXfer(models.TransientModel):
         ebics_file = self._ebics_upload()
         if ebics_file:
             ctx["ebics_file_id"] = ebics_file.id
-        module = __name__.split("addons.")[1].split(".")[0]
-        result_view = self.env.ref("%s.ebics_xfer_view_form_result" % module)
+        result_view = self.env.ref(f"{_MODULE}.ebics_xfer_view_form_result")
         return {
             "name": _("EBICS file transfer result"),
             "res_id": self.id,
@@ -218,11 +203,12 @@ class EbicsXfer(models.TransientModel):
         self.ensure_one()
         ctx = self.env.context.copy()
         self.note = ""
+        notes = []
         err_cnt = 0
         client = self._setup_client()
         if not client:
             err_cnt += 1
-            self.note += (
+            notes.append(
                 _("EBICS client setup failed for connection '%s'")
                 % self.ebics_config_id.name
             )
@@ -236,112 +222,44 @@ class EbicsXfer(models.TransientModel):
             ebics_files = self.env["ebics.file"]
             date_from = self.date_from and self.date_from.isoformat() or None
             date_to = self.date_to and self.date_to.isoformat() or None
+            date_range = (
+                {"DateRange": {"Start": date_from, "End": date_to}}
+                if date_from and date_to
+                else None
+            )
+            ef_defaults = self._get_ebics_file_defaults()
             for df in download_formats:
-                try:
-                    success = False
+                success = False
+                with self._ebics_error_handler(notes, df=df):
                     if df.order_type == "BTD":
-                        btf = BusinessTransactionFormat(
-                            df.btf_service,
-                            df.btf_message,
-                            scope=df.btf_scope or None,
-                            option=df.btf_option or None,
-                            container=df.btf_container or None,
-                            version=df.btf_version or None,
-                            variant=df.btf_variant or None,
-                            format=df.btf_format or None,
-                        )
+                        btf = self._get_btf(df)
                         data = client.BTD(btf, start=date_from, end=date_to)
                     elif df.order_type == "FDL":
                         data = client.FDL(df.name, date_from, date_to)
                     else:
-                        params = None
-                        if date_from and date_to:
-                            params = {
-                                "DateRange": {
-                                    "Start": date_from,
-                                    "End": date_to,
-                                }
-                            }
-                        data = client.download(df.order_type, params=params)
-                    ebics_files += self._handle_download_data(data, df)
-                    success = True
-                except EbicsFunctionalError:
-                    err_cnt += 1
-                    e = exc_info()
-                    self.note += "\n"
-                    self.note += _(
-                        "EBICS Functional Error during download of "
-                        "File Format %(name)s (%(order_type)s):",
-                        name=df.name or df.description,
-                        order_type=df.order_type,
-                    )
-                    self.note += "\n"
-                    self.note += f"{e[1].message} (code: {e[1].code})"
-                except EbicsTechnicalError:
-                    err_cnt += 1
-                    e = exc_info()
-                    self.note += "\n"
-                    self.note += _(
-                        "EBICS Technical Error during download of "
-                        "File Format %(name)s (%(order_type)s):",
-                        name=df.name or df.description,
-                        order_type=df.order_type,
-                    )
-                    self.note += "\n"
-                    self.note += f"{e[1].message} (code: {e[1].code})"
-                except EbicsVerificationError:
-                    err_cnt += 1
-                    self.note += "\n"
-                    self.note += _(
-                        "EBICS Verification Error during download of "
-                        "File Format %(name)s (%(order_type)s):",
-                        name=df.name or df.description,
-                        order_type=df.order_type,
-                    )
-                    self.note += "\n"
-                    self.note += _("The EBICS response could not be verified.")
-                except UserError as e:
-                    err_cnt += 1
-                    self.note += "\n"
-                    self.note += _(
-                        "Error detected during download of "
-                        "File Format %(name)s (%(order_type)s):",
-                        name=df.name or df.description,
-                        order_type=df.order_type,
-                    )
-                    self.note += "\n"
-                    self.note += " ".join(e.args)
-                except Exception:
-                    err_cnt += 1
-                    self.note += "\n"
-                    self.note += _(
-                        "Unknown Error during download of "
-                        "File Format %(name)s (%(order_type)s):",
-                        name=df.name or df.description,
-                        order_type=df.order_type,
+                        data = client.download(df.order_type, params=date_range)
+                    ebics_files += self._handle_download_data(
+                        data, df, ef_defaults=ef_defaults
                     )
-                    tb = "".join(format_exception(*exc_info()))
-                    self.note += "\n%s" % tb
-                else:
+                    success = True
+                if success:
                     # mark received data so that it is not included in further
                     # downloads
                     trans_id = client.last_trans_id
                     client.confirm_download(trans_id=trans_id, success=success)
+                else:
+                    err_cnt += 1
 
             ctx["ebics_file_ids"] = ebics_files.ids
 
             if ebics_files:
-                self.note += "\n"
-                for f in ebics_files:
-                    self.note += (
-                        _("EBICS File '%s' is available for further processing.")
-                        % f.name
-                    )
-                    self.note += "\n"
+                msg = _("EBICS File '%s' is available for further processing.")
+                notes.append("\n")
+                notes.extend(f"{msg % name}\n" for name in ebics_files.mapped("name"))
 
+        self.note += "".join(notes)
         ctx["err_cnt"] = err_cnt
-        module = __name__.split("addons.")[1].split(".")[0]
-        result_view = self.env.ref("%s.ebics_xfer_view_form_result" % module)
+        result_view = self.env.ref(f"{_MODULE}.ebics_xfer_view_form_result")
         return {
             "name": _("EBICS file transfer result"),
             "res_id": self.id,
@@ -356,9 +274,8 @@ class EbicsXfer(models.TransientModel):
 
     def view_ebics_file(self):
         self.ensure_one()
-        module = __name__.split("addons.")[1].split(".")[0]
         act = self.env["ir.actions.act_window"]._for_xml_id(
-            f"{module}.ebics_file_action_download"
+            f"{_MODULE}.ebics_file_action_download"
         )
         act["domain"] = [("id", "in", self._context["ebics_file_ids"])]
         return act
@@ -367,24 +284,16 @@ class EbicsXfer(models.TransientModel):
         self.ensure_one()
         ebics_file = self.env["ebics.file"]
         self.note = ""
+        notes = []
         client = self._setup_client()
         if client:
-            upload_data = base64.decodebytes(self.upload_data)
+            upload_data = base64.b64decode(self.upload_data)
             ef_format = self.format_id
             OrderID = False
-            try:
+            with self._ebics_error_handler(notes):
                 order_type = self.order_type
                 if order_type == "BTU":
-                    btf = BusinessTransactionFormat(
-                        ef_format.btf_service,
-                        ef_format.btf_message,
-                        scope=ef_format.btf_scope or None,
-                        option=ef_format.btf_option or None,
-                        container=ef_format.btf_container or None,
-                        version=ef_format.btf_version or None,
-                        variant=ef_format.btf_variant or None,
-                        format=ef_format.btf_format or None,
-                    )
+                    btf = self._get_btf(ef_format)
                     kwargs = {}
                     if self.test_mode:
                         kwargs["TEST"] = "TRUE"
@@ -400,12 +309,18 @@ class EbicsXfer(models.TransientModel):
                     OrderID = client.FUL(ef_format.name, upload_data, **kwargs)
                 else:
                     OrderID = client.upload(order_type, upload_data)
+                # the ebics.file below stores the base64 field value,
+                # release the decoded copy before creating it
+                del upload_data
                 if OrderID:
-                    self.note += "\n"
-                    self.note += (
-                        _("EBICS File has been uploaded (OrderID %s).") % OrderID
-                    )
+                    notes += [
+                        "\n",
+                        _("EBICS File has been uploaded (OrderID %s).") % OrderID,
+                    ]
                     ef_note = _("EBICS OrderID: %s") % OrderID
+                    company_id = self.env.context.get(
+                        "force_company", self.env.company.id
+                    )
                     if self.env.context.get("origin"):
                         ef_note += "\n" + _("Origin: %s") % self._context["origin"]
                     suffix = self.format_id.suffix
@@ -413,7 +328,7 @@ class EbicsXfer(models.TransientModel):
                     if suffix and not fn.endswith(suffix):
                         fn = ".".join([fn, suffix])
                     ef_vals = {
-                        "name": self.upload_fname,
+                        "name": fn,
                         "data": self.upload_data,
                         "date": fields.Datetime.now(),
                         "format_id": self.format_id.id,
@@ -421,43 +336,100 @@ class EbicsXfer(models.TransientModel):
                         "user_id": self._uid,
                         "ebics_userid_id": self.ebics_userid_id.id,
                         "note": ef_note,
-                        "company_ids": [
-                            self.env.context.get("force_company", self.env.company.id)
-                        ],
+                        "company_ids": [(6, 0, [company_id])],
                     }
                     self._update_ef_vals(ef_vals)
                     ebics_file = self.env["ebics.file"].create(ef_vals)
 
-            except EbicsFunctionalError:
-                e = exc_info()
-                self.note += "\n"
-                self.note += _("EBICS Functional Error:")
-                self.note += "\n"
-                self.note += f"{e[1].message} (code: {e[1].code})"
-            except EbicsTechnicalError:
-                e = exc_info()
-                self.note += "\n"
-                self.note += _("EBICS Technical Error:")
-                self.note += "\n"
-                self.note += f"{e[1].message} (code: {e[1].code})"
-            except EbicsVerificationError:
-                self.note += "\n"
-                self.note += _("EBICS Verification Error:")
-                self.note += "\n"
-                self.note += _("The EBICS response could not be verified.")
-            except Exception:
-                self.note += "\n"
-                self.note += _("Unknown Error")
-                tb = "".join(format_exception(*exc_info()))
-                self.note += "\n%s" % tb
-
             if self.ebics_config_id.ebics_version == "H003":
                 OrderID = self.ebics_config_id._get_order_number()
                 self.ebics_config_id.sudo()._update_order_number(OrderID)
 
+        self.note += "".join(notes)
+
         ebics_file and self._payment_order_postprocess(ebics_file)
         return ebics_file
 
+    @contextmanager
+    def _ebics_error_handler(self, notes, df=None):
+        """
+        Report errors raised during an EBICS transfer in the notes
+        instead of aborting the wizard.
+        """
+        try:
+            yield
+        except EbicsFunctionalError as err:
+            notes += [
+                "\n",
+                self._ebics_error_title("functional", df),
+                "\n",
+                f"{err.message} (code: {err.code})",
+            ]
+        except EbicsTechnicalError as err:
+            notes += [
+                "\n",
+                self._ebics_error_title("technical", df),
+                "\n",
+                f"{err.message} (code: {err.code})",
+            ]
+        except EbicsVerificationError:
+            notes += [
+                "\n",
+                self._ebics_error_title("verification", df),
+                "\n",
+                _("The EBICS response could not be verified."),
+            ]
+        except Exception as err:
+            if df and isinstance(err, UserError):
+                error, detail = "user", " ".join(err.args)
+            else:
+                error, detail = "unknown", format_exc()
+            notes += ["\n", self._ebics_error_title(error, df), "\n", detail]
+
+    def _ebics_error_title(self, error, df=None):
+        if not df:
+            if error == "functional":
+                return _("EBICS Functional Error:")
+            if error == "technical":
+                return _("EBICS Technical Error:")
+            if error == "verification":
+                return _("EBICS Verification Error:")
+            return _("Unknown Error")
+        name = df.name or df.description
+        if error == "functional":
+            return _(
+                "EBICS Functional Error during download of "
+                "File Format %(name)s (%(order_type)s):",
+                name=name,
+                order_type=df.order_type,
+            )
+        if error == "technical":
+            return _(
+                "EBICS Technical Error during download of "
+                "File Format %(name)s (%(order_type)s):",
+                name=name,
+                order_type=df.order_type,
+            )
+        if error == "verification":
+            return _(
+                "EBICS Verification Error during download of "
+                "File Format %(name)s (%(order_type)s):",
+                name=name,
+                order_type=df.order_type,
+            )
+        if error == "user":
+            return _(
+                "Error detected during download of "
+                "File Format %(name)s (%(order_type)s):",
+                name=name,
+                order_type=df.order_type,
+            )
+        return _(
+            "Unknown Error during download of File Format %(name)s (%(order_type)s):",
+            name=name,
+            order_type=df.order_type,
+        )
+
     def _payment_order_postprocess(self, ebics_file):
         active_model = self.env.context.get("model")
         if active_model == "account.payment.order":
@@ -467,10 +439,12 @@ class EbicsXfer(models.TransientModel):
             order.generated2uploaded()
 
     def _setup_client(self):
-        self.ebics_config_id._check_ebics_keys()
+        cfg = self.ebics_config_id
+        ebics_userid = self.ebics_userid_id
+        cfg._check_ebics_keys()
         passphrase = self._get_passphrase()
         keyring_params = {
-            "keys": self.ebics_userid_id.ebics_keys_fn,
+            "keys": ebics_userid.ebics_keys_fn,
             "passphrase": passphrase,
         }
         if self.ebics_sig_passphrase:
@@ -485,20 +459,18 @@ class EbicsXfer(models.TransientModel):
 
         bank = EbicsBank(
             keyring=keyring,
-            hostid=self.ebics_config_id.ebics_host,
-            url=self.ebics_config_id.ebics_url,
+            hostid=cfg.ebics_host,
+            url=cfg.ebics_url,
         )
-        if self.ebics_config_id.ebics_version == "H003":
-            bank._order_number = self.ebics_config_id._get_order_number()
+        if cfg.ebics_version == "H003":
+            bank._order_number = cfg._get_order_number()
 
-        signature_class = (
-            self.format_id.signature_class or self.ebics_userid_id.signature_class
-        )
+        signature_class = self.format_id.signature_class or ebics_userid.signature_class
 
         user_params = {
             "keyring": keyring,
-            "partnerid": self.ebics_config_id.ebics_partner,
-            "userid": self.ebics_userid_id.name,
+            "partnerid": cfg.ebics_partner,
+            "userid": ebics_userid.name,
         }
         # manual_approval replaced by transport_only class param in fintech 7.4
         fintech74 = hasattr(EbicsUser, "transport_only")
@@ -510,7 +482,7 @@ class EbicsXfer(models.TransientModel):
             error = _("Error while accessing the EBICS UserID:")
             error += "\n"
             err_str = err.args[0]
-            error += err.args[0]
+            error += err_str
             if err_str == "unknown key format":
                 error += "\n"
                 error += _("Doublecheck your EBICS Passphrase and UserID settings.")
@@ -520,16 +492,25 @@ class EbicsXfer(models.TransientModel):
             user.manual_approval = True
 
         try:
-            client = EbicsClient(bank, user, version=self.ebics_config_id.ebics_version)
+            client = EbicsClient(bank, user, version=cfg.ebics_version)
         except Exception:
-            self.note += "\n"
-            self.note += _("Unknown Error")
-            tb = "".join(format_exception(*exc_info()))
-            self.note += "\n%s" % tb
+            self.note += "\n" + _("Unknown Error") + "\n" + format_exc()
             client = False
 
         return client
 
+    def _get_btf(self, file_format):
+        return BusinessTransactionFormat(
+            file_format.btf_service,
+            file_format.btf_message,
+            scope=file_format.btf_scope or None,
+            option=file_format.btf_option or None,
+            container=file_format.btf_container or None,
+            version=file_format.btf_version or None,
+            variant=file_format.btf_variant or None,
+            format=file_format.btf_format or None,
+        )
+
     def _get_passphrase(self):
         return self.ebics_passphrase or self.ebics_passphrase_stored
 
@@ -552,72 +533,117 @@ class EbicsXfer(models.TransientModel):
         """
         if self.format_id and self.format_id.type == "up":
             fn = ef_vals["name"]
-            dups = self._check_duplicate_ebics_file(fn, self.format_id)
-            if dups:
+            dups = self.env["ebics.file"].search_read(
+                [("name", "=like", fn + "%"), ("format_id", "=", self.format_id.id)],
+                ["name"],
+            )
+            taken = {x["name"] for x in dups}
+            if fn in taken:
                 n = 1
-                fn = "_".join([fn, str(n)])
-                while self._check_duplicate_ebics_file(fn, self.format_id):
+                while f"{fn}_{n}" in taken:
                     n += 1
-                    fn = "_".join([fn, str(n)])
-                ef_vals["name"] = fn
+                ef_vals["name"] = f"{fn}_{n}"
 
-    def _handle_download_data(self, data, file_format):
-        ebics_files = self.env["ebics.file"]
+    def _get_ebics_file_defaults(self):
+        """
+        Values shared by all EBICS Files created by this wizard,
+        read once per download instead of once per file.
+        """
+        cfg = self.ebics_config_id
+        return {
+            "fn_prefix": "_".join([cfg.ebics_host, cfg.ebics_partner]),
+            "fn_date": (self.date_to or fields.Date.today()).isoformat(),
+            "date_from": self.date_from,
+            "date_to": self.date_to,
+            "ebics_userid_id": self.ebics_userid_id.id,
+            "company_ids": [(6, 0, cfg.company_ids.ids)],
+            "ff_methods": self._file_format_methods(),
+        }
+
+    def _handle_download_data(self, data, file_format, ef_defaults=None):
+        if ef_defaults is None:
+            ef_defaults = self._get_ebics_file_defaults()
         if isinstance(data, dict):
-            for doc in data:
-                ebics_files += self._create_ebics_file(
-                    data[doc], file_format, docname=doc
+            vals_list = [
+                self._prepare_ebics_file_vals(
+                    doc_data,
+                    file_format,
+                    docname=doc,
+                    ef_defaults=ef_defaults,
+                    check_duplicate=False,
                 )
+                for doc, doc_data in data.items()
+            ]
         else:
-            ebics_files += self._create_ebics_file(data, file_format)
-        return ebics_files
+            vals_list = [
+                self._prepare_ebics_file_vals(
+                    data, file_format, ef_defaults=ef_defaults, check_duplicate=False
+                )
+            ]
+        dups = self.env["ebics.file"].search_read(
+            [
+                ("name", "in", [x["name"] for x in vals_list]),
+                ("format_id", "=", file_format.id),
+            ],
+            ["name"],
+            limit=1,
+        )
+        if dups:
+            raise UserError(self._duplicate_ebics_file_msg(dups[0]["name"]))
+        return self.env["ebics.file"].create(vals_list)
 
-    def _create_ebics_file(self, data, file_format, docname=None):
-        fn_parts = [self.ebics_config_id.ebics_host, self.ebics_config_id.ebics_partner]
-        if docname:
-            fn_parts.append(docname)
-        else:
-            fn_date = self.date_to or fields.Date.today()
-            fn_parts.append(fn_date.isoformat())
-        fn = "_".join(fn_parts)
-        ff_methods = self._file_format_methods()
-        if file_format.name in ff_methods:
-            data = ff_methods[file_format.name](data)
+    def _create_ebics_file(self, data, file_format, docname=None, ef_defaults=None):
+        ef_vals = self._prepare_ebics_file_vals(
+            data, file_format, docname=docname, ef_defaults=ef_defaults
+        )
+        return self.env["ebics.file"].create(ef_vals)
+
+    def _prepare_ebics_file_vals(
+        self, data, file_format, docname=None, ef_defaults=None, check_duplicate=True
+    ):
+        if ef_defaults is None:
+            ef_defaults = self._get_ebics_file_defaults()
+        fn = "_".join([ef_defaults["fn_prefix"], docname or ef_defaults["fn_date"]])
+        ff_method = ef_defaults["ff_methods"].get(file_format.name)
+        if ff_method:
+            data = ff_method(data)
 
         suffix = file_format.suffix
         if suffix and not fn.endswith(suffix):
             fn = ".".join([fn, suffix])
-        dups = self._check_duplicate_ebics_file(fn, file_format)
-        if dups:
-            raise UserError(
-                _(
-                    "EBICS File with name '%s' has already been downloaded."
-                    "\nPlease check this file and rename in case there is "
-                    "no risk on duplicate transactions."
-                )
-                % fn
-            )
-        data = base64.encodebytes(data)
+        if check_duplicate and self._check_duplicate_ebics_file(fn, file_format):
+            raise UserError(self._duplicate_ebics_file_msg(fn))
+        data = base64.b64encode(data)
         ef_vals = {
             "name": fn,
             "data": data,
             "date": fields.Datetime.now(),
-            "date_from": self.date_from,
-            "date_to": self.date_to,
+            "date_from": ef_defaults["date_from"],
+            "date_to": ef_defaults["date_to"],
             "format_id": file_format.id,
             "user_id": self._uid,
-            "ebics_userid_id": self.ebics_userid_id.id,
-            "company_ids": self.ebics_config_id.company_ids.ids,
+            "ebics_userid_id": ef_defaults["ebics_userid_id"],
+            "company_ids": ef_defaults["company_ids"],
         }
         self._update_ef_vals(ef_vals)
-        ebics_file = self.env["ebics.file"].create(ef_vals)
-        return ebics_file
+        return ef_vals
+
+    def _duplicate_ebics_file_msg(self, fn):
+        return (
+            _(
+                "EBICS File with name '%s' has already been downloaded."
+                "\nPlease check this file and rename in case there is "
+                "no risk on duplicate transactions."
+            )
+            % fn
+        )
 
     def _check_duplicate_ebics_file(self, fn, file_format):
-        dups = self.env["ebics.file"].search(
-            [("name", "=", fn), ("format_id", "=", file_format.id)]
+        return bool(
+            self.env["ebics.file"].search_count(
+                [("name", "=", fn), ("format_id", "=", file_format.id)], limit=1
+            )
         )
-        return dups
 
     def _detect_upload_format(self):
         """
@@ -626,30 +652,16 @@ class EbicsXfer(models.TransientModel):
         """
 
     def _update_order_number(self, OrderID):
-        o_list = list(OrderID)
-        for i, c in enumerate(reversed(o_list), start=1):
-            if c == "9":
-                o_list[-i] = "A"
-                break
-            if c == "Z":
-                continue
-            else:
-                o_list[-i] = chr(ord(c) + 1)
-                break
-        next_nr = "".join(o_list)
-        if next_nr == "ZZZZ":
-            next_nr = "A000"
-        self.ebics_config_id.order_number = next_nr
+        self.ebics_config_id._update_order_number(OrderID)
 
     def _insert_line_terminator(self, data_in, line_len):
-        data_in = data_in.replace(b"\n", b"").replace(b"\r", b"")
-        data_out = b""
-        max_len = len(data_in)
-        i = 0
-        while i + line_len <= max_len:
-            data_out += data_in[i : i + line_len] + b"\n"
-            i += line_len
-        return data_out
+        data_in = data_in.translate(None, b"\r\n")
+        max_len = len(data_in) - len(data_in) % line_len
+        if not max_len:
+            return b""
+        mv = memoryview(data_in)
+        lines = (mv[i : i + line_len] for i in range(0, max_len, line_len))
+        return b"\n".join(lines) + b"\n"
 
     def _handle_cfonb120(self, data_in):
         return self._insert_line_terminator(data_in, 120)
@@ -1,8 +1,8 @@
 # Copyright 2009-2024 Noviat.
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from sys import exc_info
-from traceback import format_exception
+from contextlib import contextmanager
+from traceback import format_exc
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
@@ -42,8 +42,9 @@ class EbicsBatchLog(models.Model):
 
     @api.depends("file_ids")
     def _compute_ebics_files_fields(self):
+        self.file_ids.fetch(["state"])
         for rec in self:
-            rec.has_draft_files = "draft" in rec.file_ids.mapped("state")
+            rec.has_draft_files = any(f.state == "draft" for f in rec.file_ids)
             rec.file_count = len(rec.file_ids)
 
     def unlink(self):
@@ -91,6 +92,7 @@ class EbicsBatchLog(models.Model):
                 "date_to": date_to,
             }
         )
+        configs.ebics_userid_ids.fetch(["ebics_passphrase_store", "signature_class"])
         ebics_file_ids = []
         for config in configs:
             err_msg = (
@@ -114,25 +116,31 @@ class EbicsBatchLog(models.Model):
                     )
                 )
                 continue
-            try:
-                with self.env.cr.savepoint():
-                    ebics_file_ids += self._ebics_import(
-                        config, date_from, date_to, import_dict
-                    )
-            except UserError as e:
-                import_dict["errors"].append(err_msg + " ".join(e.args))
-            except Exception:
-                tb = "".join(format_exception(*exc_info()))
-                import_dict["errors"].append(err_msg + tb)
+            with (
+                self._import_error_handler(import_dict, err_msg),
+                self.env.cr.savepoint(),
+            ):
+                ebics_file_ids += self._ebics_import(
+                    config, date_from, date_to, import_dict
+                )
         log.file_ids = [(6, 0, ebics_file_ids)]
-        try:
+        err_msg = _("Error while processing EBICS Files:\n")
+        with self._import_error_handler(import_dict, err_msg):
             log._ebics_process(import_dict)
+        log._finalise_processing(import_dict)
+
+    @contextmanager
+    def _import_error_handler(self, import_dict, err_msg):
+        """
+        Add errors raised during the batch import to the import errors
+        instead of aborting the cron job.
+        """
+        try:
+            yield
         except UserError as e:
             import_dict["errors"].append(err_msg + " ".join(e.args))
         except Exception:
-            tb = "".join(format_exception(*exc_info()))
-            import_dict["errors"].append(err_msg + tb)
-        log._finalise_processing(import_dict)
+            import_dict["errors"].append(err_msg + format_exc())
 
     def _finalise_processing(self, import_dict):
         log_item_model = self.env["ebics.batch.log.item"]
@@ -158,20 +166,21 @@ class EbicsBatchLog(models.Model):
             lambda r: r.ebics_passphrase_store
         )
         t_userids = ebics_userids.filtered(lambda r: r.signature_class == "T")
-        ebics_userid = t_userids and t_userids[0] or ebics_userids[0]
+        ebics_userid = t_userids[:1] or ebics_userids[:1]
+        down_formats = config.ebics_file_format_ids.filtered(lambda r: r.type == "down")
         xfer_wiz = (
             self.env["ebics.xfer"]
             .with_context(ebics_download=True)
             .create(
                 {
                     "ebics_config_id": config.id,
+                    "ebics_userid_id": ebics_userid.id,
+                    "format_id": len(down_formats) == 1 and down_formats.id,
                     "date_from": date_from,
                     "date_to": date_to,
                 }
             )
         )
-        xfer_wiz._onchange_ebics_config_id()
-        xfer_wiz.ebics_userid_id = ebics_userid
         res = xfer_wiz.ebics_download()
         file_ids = res["context"].get("ebics_file_ids", [])
         if res["context"]["err_cnt"]:
@@ -17,7 +17,8 @@ class AccountBatchPayment(models.Model):
             [
                 ("journal_ids", "=", self.journal_id.id),
                 ("state", "=", "confirm"),
-            ]
+            ],
+            limit=2,
         )
         if not ebics_config:
             raise UserError(
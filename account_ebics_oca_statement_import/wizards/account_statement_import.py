@@ -2,7 +2,7 @@
 # License LGPL-3 or later (http://www.gnu.org/licenses/lgpl).
 
 import logging
-from datetime import date, datetime
+from datetime import date
 
 from odoo import _, models
 
@@ -17,18 +17,21 @@ class AccountStatementImport(models.TransientModel):
     def _match_journal(self, account_number, currency):
         journal = self.env["account.journal"]
         sanitized_account_number = self._sanitize_account_number(account_number)
-        fin_journals = self.env["account.journal"].search(
-            [
-                ("type", "=", "bank"),
-                "|",
-                ("currency_id", "=", currency.id),
-                ("company_id.currency_id", "=", currency.id),
-            ]
-        )
-        fin_journal = fin_journals.filtered(
-            lambda r: sanitized_account_number
-            in (r.bank_account_id.sanitized_acc_number or "")
-        )
+        domain = [
+            ("type", "=", "bank"),
+            "|",
+            ("currency_id", "=", currency.id),
+            ("company_id.currency_id", "=", currency.id),
+        ]
+        if sanitized_account_number:
+            domain.append(
+                (
+                    "bank_account_id.sanitized_acc_number",
+                    "like",
+                    sanitized_account_number,
+                )
+            )
+        fin_journal = self.env["account.journal"].search(domain, limit=2)
         if len(fin_journal) == 1:
             journal = fin_journal
         if not journal:
@@ -38,10 +41,10 @@ class AccountStatementImport(models.TransientModel):
     def _sanitize_account_number(self, account_number):
         sanitized_number = sanitize_account_number(account_number)
         check_curr = sanitized_number[-3:]
-        if check_curr.isalpha():
-            all_currencies = self.env["res.currency"].search([])
-            if check_curr in all_currencies.mapped("name"):
-                sanitized_number = sanitized_number[:-3]
+        if check_curr.isalpha() and self.env["res.currency"].search_count(
+            [("name", "=", check_curr)], limit=1
+        ):
+            sanitized_number = sanitized_number[:-3]
         return sanitized_number
 
     def _check_parsed_data(self, stmts_vals):
@@ -51,20 +54,14 @@ class AccountStatementImport(models.TransientModel):
             if len(stmts_vals) == 0:
                 message = _("This file doesn't contain any statement.")
             if not message:
-                no_st_line = True
-                for vals in stmts_vals:
-                    if vals["transactions"] and len(vals["transactions"]) > 0:
-                        no_st_line = False
-                        break
-                if no_st_line:
+                if not any(vals["transactions"] for vals in stmts_vals):
                     message = _("This file doesn't contain any transaction.")
                 if message:
-                    log_msg = (
-                        _("Error detected while processing and EBICS File")
-                        + ":\n"
-                        + message
+                    _logger.warning(
+                        "%s:\n%s",
+                        _("Error detected while processing and EBICS File"),
+                        message,
                     )
-                    _logger.warning(log_msg)
                     return
         return super()._check_parsed_data(stmts_vals)
 
@@ -84,18 +81,16 @@ class AccountStatementImport(models.TransientModel):
             messages = []
             transactions = False
             for st_vals in stmts_vals:
-                statement_ids = result["statement_ids"][:]
+                statement_count = len(result["statement_ids"])
                 self._set_statement_name(st_vals)
                 if st_vals.get("transactions"):
                     transactions = True
                     super()._create_bank_statements([st_vals], result)
-                    if result["statement_ids"] == statement_ids:
+                    if len(result["statement_ids"]) == statement_count:
                         # no statement has been created, this is the case
                         # when all transactions have been imported already
-                        if isinstance(st_vals["date"], date) or isinstance(
-                            st_vals["date"], datetime
-                        ):
-                            st_date = st_vals["date"].strftime("%Y-%m-%d")
+                        if isinstance(st_vals["date"], date):
+                            st_date = st_vals["date"].isoformat()[:10]
                         else:
                             st_date = st_vals["date"]
                         messages.append(
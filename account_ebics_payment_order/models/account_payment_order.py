@@ -10,20 +10,13 @@ class AccountPaymentOrder(models.Model):
 
     def ebics_upload(self):
         self.ensure_one()
-        ctx = self.env.context.copy()
         ebics_format_id = self.payment_mode_id.ebics_format_id
         if not ebics_format_id:
             raise UserError(
                 _("Missing EBICS File Format setting on your Payment Mode.")
             )
-        ctx.update(
-            {
-                "active_model": self._name,
-                "default_format_id": ebics_format_id.id,
-            }
-        )
         attach = self.env["ir.attachment"].search(
-            [("res_model", "=", self._name), ("res_id", "=", self.id)]
+            [("res_model", "=", self._name), ("res_id", "=", self.id)], limit=2
         )
         if not attach:
             raise UserError(
@@ -47,7 +40,8 @@ class AccountPaymentOrder(models.Model):
                 [
                     ("journal_ids", "=", self.journal_id.id),
                     ("state", "=", "confirm"),
-                ]
+                ],
+                limit=2,
             )
             if not ebics_config:
                 raise UserError(
@@ -56,15 +50,16 @@ class AccountPaymentOrder(models.Model):
                         "for the selected bank."
                     )
                 )
+            ctx = dict(
+                self.env.context,
+                active_model=self._name,
+                default_format_id=ebics_format_id.id,
+                default_upload_data=attach.datas,
+                default_upload_fname=attach.name,
+                origin=origin,
+            )
             if len(ebics_config) == 1:
                 ctx["default_ebics_config_id"] = ebics_config.id
-            ctx.update(
-                {
-                    "default_upload_data": attach.datas,
-                    "default_upload_fname": attach.name,
-                    "origin": origin,
-                }
-            )
             ebics_xfer = (
                 self.env["ebics.xfer"]
                 .with_company(self.company_id)
@@ -72,7 +67,6 @@ class AccountPaymentOrder(models.Model):
                 .create({})
             )
             ebics_xfer._onchange_ebics_config_id()
-            ebics_xfer._onchange_upload_data()
             view = self.env.ref("account_ebics.ebics_xfer_view_form_upload")
             act = {
                 "name": _("EBICS Upload"),